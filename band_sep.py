@@ -1,12 +1,14 @@
 import serial
 import time
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
+import threading
 import numpy as np
 from collections import deque
+import pyqtgraph as pg
+from pyqtgraph.Qt import QtCore
+from tgam_parser import RAW_SAMPLE, TgamParser, decode_eeg_power, iter_values
 
 class BrainwaveMonitor:
-    def __init__(self, port='/dev/cu.usbmodem497D486D324D1', baudrate=115200):
+    def __init__(self, port='/dev/cu.usbmodem497D486D324D1', baudrate=115200, debug=False):
         print(f"Initializing connection to {port}")
         self.serial_port = serial.Serial(
             port=port,
@@ -14,186 +16,137 @@ class BrainwaveMonitor:
             bytesize=serial.EIGHTBITS,
             parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE,
-            timeout=1
+            timeout=0.02  # Bounds how long the reader thread waits for a full chunk
         )
         
-        # Data buffers
-        self.raw_data = deque(maxlen=512)
+        self.debug = debug
+        
+        # Data buffers (preallocated ring buffers, head counts samples written;
+        # plotted buffers start as NaN so unfilled slots are not drawn)
+        self.raw_data = np.zeros(512, dtype=np.float32)
+        self.raw_head = 0
         self.signal_quality = 0
         self.buffer_size = 100
+        self.x_axis = np.arange(self.buffer_size, dtype=np.float32)
         
-        # Initialize brainwave band buffers
-        self.bands = {
-            'Delta': deque(maxlen=self.buffer_size),     # 0.5 - 2.75 Hz
-            'Theta': deque(maxlen=self.buffer_size),     # 3.5 - 6.75 Hz
-            'Low-Alpha': deque(maxlen=self.buffer_size), # 7.5 - 9.25 Hz
-            'High-Alpha': deque(maxlen=self.buffer_size),# 10 - 11.75 Hz
-            'Low-Beta': deque(maxlen=self.buffer_size),  # 13 - 16.75 Hz
-            'High-Beta': deque(maxlen=self.buffer_size), # 18 - 29.75 Hz
-            'Low-Gamma': deque(maxlen=self.buffer_size), # 31 - 39.75 Hz
-            'Mid-Gamma': deque(maxlen=self.buffer_size)  # 41 - 49.75 Hz
-        }
+        # Brainwave band buffers: one (band, sample) ring shared by all 8 bands
+        self.band_names = (
+            'Delta',      # 0.5 - 2.75 Hz
+            'Theta',      # 3.5 - 6.75 Hz
+            'Low-Alpha',  # 7.5 - 9.25 Hz
+            'High-Alpha', # 10 - 11.75 Hz
+            'Low-Beta',   # 13 - 16.75 Hz
+            'High-Beta',  # 18 - 29.75 Hz
+            'Low-Gamma',  # 31 - 39.75 Hz
+            'Mid-Gamma'   # 41 - 49.75 Hz
+        )
+        # Every sample is stored twice (slot and slot + buffer_size), so the latest
+        # buffer_size samples of each band are always a contiguous row slice
+        self.band_buf = np.full((len(self.band_names), 2 * self.buffer_size), np.nan, dtype=np.float32)
+        self.band_head = 0
+        self.bands_dirty = False  # New band samples not yet plotted
         
         # Packet parsing state
-        self.packet_buffer = bytearray()
-        self.packet_state = 'SYNC1'
+        self.parser = TgamParser()
         
         # Setup visualization
         self.setup_visualization()
+        
+        # Serial reads happen on a background thread and are handed over through
+        # a deque (append/popleft are atomic, so no lock is needed)
+        self.rx_chunks = deque()
+        self.reading = True
+        self.reader_thread = threading.Thread(target=self.read_serial, daemon=True)
+        self.reader_thread.start()
     
     def setup_visualization(self):
-        plt.style.use('dark_background')
-        self.fig = plt.figure(figsize=(15, 10))
+        # pyqtgraph instead of matplotlib: plain line updates on a rolling
+        # buffer are far cheaper and FuncAnimation's frame caching is avoided
+        self.app = pg.mkQApp('Brainwave Monitor')
+        self.win = pg.GraphicsLayoutWidget(title='Brainwave Monitor')
+        self.win.resize(1500, 1000)
         
-        # Create grid of subplots for each brainwave band
-        self.axes = {}
+        # Create grid of plots for each brainwave band
+        self.curves = []
         grid_size = (4, 2)
-        for idx, (band_name, _) in enumerate(self.bands.items()):
-            ax = self.fig.add_subplot(grid_size[0], grid_size[1], idx + 1)
-            ax.set_title(f'{band_name} Wave')
-            ax.set_ylim(0, 1000000)  # Adjust based on your data range
-            ax.grid(True, alpha=0.3)
-            self.axes[band_name] = {
-                'ax': ax,
-                'line': ax.plot([], [], label=band_name)[0]
-            }
-        
-        plt.tight_layout()
+        for idx, band_name in enumerate(self.band_names):
+            plot = self.win.addPlot(row=idx // grid_size[1], col=idx % grid_size[1],
+                                    title=f'{band_name} Wave')
+            plot.setXRange(0, self.buffer_size, padding=0)
+            plot.setYRange(0, 1000000, padding=0)  # Adjust based on your data range
+            plot.showGrid(x=True, y=True, alpha=0.3)
+            self.curves.append(plot.plot(
+                self.x_axis,
+                self.band_buf[idx, :self.buffer_size],
+                pen=(idx, len(self.band_names)),
+                connect='finite'  # Leave unfilled (NaN) slots undrawn
+            ))
     
     def parse_payload(self, payload):
-        i = 0
-        while i < len(payload):
-            # Handle extended code level
-            extended_code_level = 0
-            while i < len(payload) and payload[i] == 0x55:
-                extended_code_level += 1
-                i += 1
+        for code, value in iter_values(payload):
+            if code == 0x83:  # ASIC_EEG_POWER
+                if len(value) >= 24:  # 8 bands × 3 bytes each
+                    values = decode_eeg_power(value)
+                    slot = self.band_head % self.buffer_size
+                    self.band_buf[:, slot] = values
+                    self.band_buf[:, slot + self.buffer_size] = values
+                    self.band_head += 1
+                    self.bands_dirty = True
+                    if self.debug:
+                        for band_name, band_value in zip(self.band_names, values):
+                            print(f"{band_name}: {band_value}")
             
-            if i >= len(payload):
-                break
+            elif code == 0x80:  # Raw value
+                if len(value) >= 2:
+                    raw_value, = RAW_SAMPLE.unpack_from(value)
+                    self.raw_data[self.raw_head % len(self.raw_data)] = raw_value
+                    self.raw_head += 1
             
-            code = payload[i]
-            i += 1
-            
-            if code & 0x80:  # Multi-byte value
-                if i >= len(payload):
-                    break
-                length = payload[i]
-                i += 1
-                value_data = payload[i:i+length]
-                i += length
-                
-                if code == 0x83:  # ASIC_EEG_POWER
-                    if len(value_data) >= 24:  # 8 bands × 3 bytes each
-                        # Parse each frequency band (3 bytes each)
-                        for band_idx, (band_name, _) in enumerate(self.bands.items()):
-                            start_idx = band_idx * 3
-                            value = int.from_bytes(
-                                value_data[start_idx:start_idx+3], 
-                                byteorder='big',
-                                signed=False
-                            )
-                            self.bands[band_name].append(value)
-                            print(f"{band_name}: {value}")
-                
-                elif code == 0x80:  # Raw value
-                    if len(value_data) >= 2:
-                        raw_value = int.from_bytes(value_data[:2], 
-                                                 byteorder='big', 
-                                                 signed=True)
-                        self.raw_data.append(raw_value)
-            
-            else:  # Single-byte value
-                if i >= len(payload):
-                    break
-                value = payload[i]
-                i += 1
-                
-                if code == 0x02:  # Poor signal quality
-                    self.signal_quality = value
-                    if value > 0:
-                        print(f"Poor signal quality: {value}")
+            elif code == 0x02:  # Poor signal quality
+                self.signal_quality = value
+                if value > 0 and self.debug:
+                    print(f"Poor signal quality: {value}")
 
-    def parse_packet(self):
-        while len(self.packet_buffer) > 0:
-            if self.packet_state == 'SYNC1':
-                if self.packet_buffer[0] == 0xAA:
-                    self.packet_state = 'SYNC2'
-                self.packet_buffer = self.packet_buffer[1:]
-                
-            elif self.packet_state == 'SYNC2':
-                if len(self.packet_buffer) >= 1:
-                    if self.packet_buffer[0] == 0xAA:
-                        self.packet_state = 'PLENGTH'
-                    else:
-                        self.packet_state = 'SYNC1'
-                    self.packet_buffer = self.packet_buffer[1:]
-                    
-            elif self.packet_state == 'PLENGTH':
-                if len(self.packet_buffer) >= 1:
-                    plength = self.packet_buffer[0]
-                    if plength > 170:
-                        self.packet_state = 'SYNC1'
-                    else:
-                        self.packet_state = 'PAYLOAD'
-                    self.packet_buffer = self.packet_buffer[1:]
-                    self.payload_length = plength
-                    self.payload = bytearray()
-                    
-            elif self.packet_state == 'PAYLOAD':
-                if len(self.packet_buffer) >= self.payload_length:
-                    self.payload.extend(self.packet_buffer[:self.payload_length])
-                    self.packet_buffer = self.packet_buffer[self.payload_length:]
-                    self.packet_state = 'CHECKSUM'
-                else:
-                    break
-                    
-            elif self.packet_state == 'CHECKSUM':
-                if len(self.packet_buffer) >= 1:
-                    checksum = self.packet_buffer[0]
-                    self.packet_buffer = self.packet_buffer[1:]
-                    
-                    calculated_checksum = (~sum(self.payload) & 0xFF)
-                    if checksum == calculated_checksum:
-                        self.parse_payload(self.payload)
-                    
-                    self.packet_state = 'SYNC1'
-                else:
-                    break
+    def read_serial(self):
+        while self.reading:
+            try:
+                # Returns once 4096 bytes arrived or the 20 ms timeout expired
+                data = self.serial_port.read(4096)
+            except (serial.SerialException, OSError, TypeError):
+                break  # Port was closed underneath us
+            if data:
+                self.rx_chunks.append(data)
 
-    def update_plot(self, frame):
-        if self.serial_port.in_waiting:
-            new_data = self.serial_port.read(self.serial_port.in_waiting)
-            self.packet_buffer.extend(new_data)
-            self.parse_packet()
+    def update_plot(self):
+        # Parse chunk by chunk so at most a partial packet stays buffered
+        while self.rx_chunks:
+            self.parser.buffer_data(self.rx_chunks.popleft())
+            for payload in self.parser.parse_packets():
+                self.parse_payload(payload)
         
         # Update each brainwave band plot
-        for band_name, band_data in self.bands.items():
-            if len(band_data) > 0:
-                self.axes[band_name]['line'].set_data(
-                    range(len(band_data)), 
-                    list(band_data)
-                )
-                self.axes[band_name]['ax'].set_xlim(0, len(band_data))
-        
-        # Return all line objects for animation
-        return [data['line'] for data in self.axes.values()]
+        # (frames without a new band packet leave the curves untouched)
+        if self.bands_dirty:
+            start = self.band_head % self.buffer_size
+            band_view = self.band_buf[:, start:start + self.buffer_size]
+            for curve, band_data in zip(self.curves, band_view):
+                curve.setData(self.x_axis, band_data)
+            self.bands_dirty = False
 
     def start_monitoring(self):
         print("Starting brainwave monitoring...")
-        ani = FuncAnimation(
-            self.fig,
-            self.update_plot,
-            interval=20,
-            blit=True,
-            cache_frame_data=False
-        )
-        plt.show()
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.update_plot)
+        self.timer.start(20)
+        self.win.show()
+        pg.exec()
 
     def close(self):
+        self.reading = False
         if self.serial_port.is_open:
             self.serial_port.close()
-        plt.close()
+        self.reader_thread.join(timeout=1)
+        self.win.close()
 
 if __name__ == "__main__":
     try:
@@ -1,14 +1,34 @@
+import bisect
 import serial
 import time
+import threading
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import numpy as np
 from collections import deque
 from matplotlib.widgets import Button
-from datetime import datetime
+from tgam_parser import RAW_SAMPLE, TgamParser, iter_values
+
+def ring_view(buf, head):
+    # Latest half-buffer of samples, oldest first, as a view (no copy). Every
+    # sample is written at slot and slot + size, so the window is contiguous.
+    size = len(buf) // 2
+    start = head % size
+    return buf[start:start + size]
+
+# Signal quality levels: the lowest value of each level after 'Excellent',
+# then (label, color, whether to show the raw value) per level
+SIGNAL_QUALITY_BOUNDS = (1, 50, 100, 200)
+SIGNAL_QUALITY_LEVELS = (
+    ('Excellent', 'green', False),
+    ('Good', 'green', False),
+    ('Fair', 'yellow', True),
+    ('Poor', 'red', True),
+    ('No Contact', 'red', False)
+)
 
 class MindSetMonitor:
-    def __init__(self, port='/dev/cu.usbmodem497D486D324D1', baudrate=115200):
+    def __init__(self, port='/dev/cu.usbmodem497D486D324D1', baudrate=115200, debug=False):
         print(f"Initializing connection to {port}")
         self.serial_port = serial.Serial(
             port=port,
@@ -16,28 +36,49 @@ class MindSetMonitor:
             bytesize=serial.EIGHTBITS,
             parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE,
-            timeout=1
+            timeout=0.02  # Bounds how long the reader thread waits for a full chunk
         )
         
+        self.debug = debug
+        
+        # Preallocated mirrored ring buffers (see ring_view), each head counts
+        # samples written; they start as NaN so unfilled slots are not drawn
         self.buffer_size = 512
-        self.raw_data = deque(maxlen=self.buffer_size)
-        self.attention_data = deque(maxlen=self.buffer_size)
-        self.meditation_data = deque(maxlen=self.buffer_size)
+        self.x_axis = np.arange(self.buffer_size, dtype=np.float32)
+        self.raw_data = np.full(2 * self.buffer_size, np.nan, dtype=np.float32)
+        self.raw_head = 0
+        self.attention_data = np.full(2 * self.buffer_size, np.nan, dtype=np.float32)
+        self.attention_head = 0
+        self.meditation_data = np.full(2 * self.buffer_size, np.nan, dtype=np.float32)
+        self.meditation_head = 0
         self.signal_quality = 0
+        self.shown_signal_quality = None
+        
+        # Set when a buffer gains samples, cleared once its line is redrawn
+        self.dirty = {'eeg': False, 'attention': False, 'meditation': False}
         
         # Monitoring control
         self.is_monitoring = False
         self.monitoring_start_time = None
-        self.attention_values = []
-        self.meditation_values = []
+        # Recorded samples: preallocated for an hour at 1 Hz and doubled when full
+        self.attention_values = np.empty(3600, dtype=np.int16)
+        self.attention_count = 0
+        self.meditation_values = np.empty(3600, dtype=np.int16)
+        self.meditation_count = 0
         
         # Packet parsing state
-        self.packet_buffer = bytearray()
-        self.packet_state = 'SYNC1'
+        self.parser = TgamParser()
         
         # Setup visualization
         self.setup_visualization()
         
+        # Serial reads happen on a background thread and are handed over through
+        # a deque (append/popleft are atomic, so no lock is needed)
+        self.rx_chunks = deque()
+        self.reading = True
+        self.reader_thread = threading.Thread(target=self.read_serial, daemon=True)
+        self.reader_thread.start()
+        
     def setup_visualization(self):
         plt.style.use('dark_background')
         self.fig = plt.figure(figsize=(12, 10))
@@ -45,21 +86,24 @@ class MindSetMonitor:
         
         # Raw EEG plot
         self.ax1 = self.fig.add_subplot(gs[0])
-        self.line_eeg, = self.ax1.plot([], [], 'g-', linewidth=1)
+        self.line_eeg, = self.ax1.plot(self.x_axis, self.raw_data[:self.buffer_size], 'g-', linewidth=1)
+        self.ax1.set_xlim(0, self.buffer_size)
         self.ax1.set_ylim(-2048, 2048)
         self.ax1.set_title('Raw EEG')
         self.ax1.grid(True, alpha=0.3)
         
         # Attention plot
         self.ax2 = self.fig.add_subplot(gs[1])
-        self.line_attention, = self.ax2.plot([], [], 'b-', linewidth=1)
+        self.line_attention, = self.ax2.plot(self.x_axis, self.attention_data[:self.buffer_size], 'b-', linewidth=1)
+        self.ax2.set_xlim(0, self.buffer_size)
         self.ax2.set_ylim(0, 100)
         self.ax2.set_title('Attention')
         self.ax2.grid(True, alpha=0.3)
         
         # Meditation plot
         self.ax3 = self.fig.add_subplot(gs[2])
-        self.line_meditation, = self.ax3.plot([], [], 'r-', linewidth=1)
+        self.line_meditation, = self.ax3.plot(self.x_axis, self.meditation_data[:self.buffer_size], 'r-', linewidth=1)
+        self.ax3.set_xlim(0, self.buffer_size)
         self.ax3.set_ylim(0, 100)
         self.ax3.set_title('Meditation')
         self.ax3.grid(True, alpha=0.3)
@@ -101,9 +145,9 @@ class MindSetMonitor:
     def start_recording(self, event):
         if not self.is_monitoring:
             self.is_monitoring = True
-            self.monitoring_start_time = datetime.now()
-            self.attention_values = []
-            self.meditation_values = []
+            self.monitoring_start_time = time.monotonic()
+            self.attention_count = 0
+            self.meditation_count = 0
             self.btn_start.set_active(False)
             self.btn_stop.set_active(True)
             print("\n=== Recording Started ===")
@@ -112,17 +156,17 @@ class MindSetMonitor:
     def stop_recording(self, event):
         if self.is_monitoring:
             self.is_monitoring = False
-            duration = (datetime.now() - self.monitoring_start_time).total_seconds()
+            duration = time.monotonic() - self.monitoring_start_time
             
-            if self.attention_values and self.meditation_values:
-                avg_attention = sum(self.attention_values) / len(self.attention_values)
-                avg_meditation = sum(self.meditation_values) / len(self.meditation_values)
+            if self.attention_count and self.meditation_count:
+                avg_attention = self.attention_values[:self.attention_count].mean()
+                avg_meditation = self.meditation_values[:self.meditation_count].mean()
                 
                 result_text = f"=== Recording Results ===\n"
                 result_text += f"Duration: {duration:.1f} seconds\n"
                 result_text += f"Average Attention: {avg_attention:.1f} ({self.interpret_value(avg_attention)})\n"
                 result_text += f"Average Meditation: {avg_meditation:.1f} ({self.interpret_value(avg_meditation)})\n"
-                result_text += f"Samples: {len(self.attention_values)}"
+                result_text += f"Samples: {self.attention_count}"
                 
                 print("\n" + result_text)
                 self.results_text.set_text(result_text)
@@ -131,138 +175,92 @@ class MindSetMonitor:
             self.btn_stop.set_active(False)
             self.status_text.set_text("Status: Stopped")
 
+    def record(self, values, count, value):
+        # Store value at index count, doubling the array first if it is full
+        if count == len(values):
+            values = np.concatenate((values, np.empty_like(values)))
+        values[count] = value
+        return values
+
     def parse_payload(self, payload):
-        i = 0
-        while i < len(payload):
-            extended_code_level = 0
-            while i < len(payload) and payload[i] == 0x55:
-                extended_code_level += 1
-                i += 1
+        for code, value in iter_values(payload):
+            if code == 0x80:  # Raw value
+                if len(value) >= 2:
+                    raw_value, = RAW_SAMPLE.unpack_from(value)
+                    slot = self.raw_head % self.buffer_size
+                    self.raw_data[slot] = self.raw_data[slot + self.buffer_size] = raw_value
+                    self.raw_head += 1
+                    self.dirty['eeg'] = True
             
-            if i >= len(payload):
-                break
-                
-            code = payload[i]
-            i += 1
-            
-            if code & 0x80:  # Multi-byte value
-                if i >= len(payload):
-                    break
-                length = payload[i]
-                i += 1
-                value_data = payload[i:i+length]
-                i += length
-                
-                if code == 0x80:  # Raw value
-                    if len(value_data) >= 2:
-                        raw_value = int.from_bytes(value_data[:2], byteorder='big', signed=True)
-                        self.raw_data.append(raw_value)
-                
-            else:  # Single-byte value
-                value = payload[i] if i < len(payload) else 0
-                i += 1
-                
-                if code == 0x02:  # Poor signal quality
-                    self.signal_quality = value
-                    quality_text = f"Signal Quality: "
-                    if value == 0:
-                        quality_text += "Excellent"
-                        color = 'green'
-                    elif value < 50:
-                        quality_text += "Good"
-                        color = 'green'
-                    elif value < 100:
-                        quality_text += f"Fair ({value})"
-                        color = 'yellow'
-                    elif value < 200:
-                        quality_text += f"Poor ({value})"
-                        color = 'red'
-                    else:
-                        quality_text += "No Contact"
-                        color = 'red'
+            elif code == 0x02:  # Poor signal quality
+                self.signal_quality = value
+                # Quality rarely changes, so only touch the text artist when it does
+                if value != self.shown_signal_quality:
+                    self.shown_signal_quality = value
+                    level = bisect.bisect_right(SIGNAL_QUALITY_BOUNDS, value)
+                    label, color, show_value = SIGNAL_QUALITY_LEVELS[level]
+                    quality_text = f"Signal Quality: {label}"
+                    if show_value:
+                        quality_text += f" ({value})"
                     
-                    print(quality_text)
+                    if self.debug:
+                        print(quality_text)
                     self.signal_text.set_text(quality_text)
                     self.signal_text.set_color(color)
-                    
-                elif code == 0x04:  # Attention
-                    self.attention_data.append(value)
-                    if self.is_monitoring:
-                        self.attention_values.append(value)
-                    
-                elif code == 0x05:  # Meditation
-                    self.meditation_data.append(value)
-                    if self.is_monitoring:
-                        self.meditation_values.append(value)
-
-    def parse_packet(self):
-        while len(self.packet_buffer) > 0:
-            if self.packet_state == 'SYNC1':
-                if self.packet_buffer[0] == 0xAA:
-                    self.packet_state = 'SYNC2'
-                self.packet_buffer = self.packet_buffer[1:]
                 
-            elif self.packet_state == 'SYNC2':
-                if len(self.packet_buffer) >= 1:
-                    if self.packet_buffer[0] == 0xAA:
-                        self.packet_state = 'PLENGTH'
-                    else:
-                        self.packet_state = 'SYNC1'
-                    self.packet_buffer = self.packet_buffer[1:]
-                    
-            elif self.packet_state == 'PLENGTH':
-                if len(self.packet_buffer) >= 1:
-                    plength = self.packet_buffer[0]
-                    if plength > 170:
-                        self.packet_state = 'SYNC1'
-                    else:
-                        self.packet_state = 'PAYLOAD'
-                    self.packet_buffer = self.packet_buffer[1:]
-                    self.payload_length = plength
-                    self.payload = bytearray()
-                    
-            elif self.packet_state == 'PAYLOAD':
-                if len(self.packet_buffer) >= self.payload_length:
-                    self.payload.extend(self.packet_buffer[:self.payload_length])
-                    self.packet_buffer = self.packet_buffer[self.payload_length:]
-                    self.packet_state = 'CHECKSUM'
-                else:
-                    break
-                    
-            elif self.packet_state == 'CHECKSUM':
-                if len(self.packet_buffer) >= 1:
-                    checksum = self.packet_buffer[0]
-                    self.packet_buffer = self.packet_buffer[1:]
-                    
-                    calculated_checksum = (~sum(self.payload) & 0xFF)
-                    if checksum == calculated_checksum:
-                        self.parse_payload(self.payload)
-                    
-                    self.packet_state = 'SYNC1'
-                else:
-                    break
+            elif code == 0x04:  # Attention
+                slot = self.attention_head % self.buffer_size
+                self.attention_data[slot] = self.attention_data[slot + self.buffer_size] = value
+                self.attention_head += 1
+                self.dirty['attention'] = True
+                if self.is_monitoring:
+                    self.attention_values = self.record(self.attention_values, self.attention_count, value)
+                    self.attention_count += 1
+                
+            elif code == 0x05:  # Meditation
+                slot = self.meditation_head % self.buffer_size
+                self.meditation_data[slot] = self.meditation_data[slot + self.buffer_size] = value
+                self.meditation_head += 1
+                self.dirty['meditation'] = True
+                if self.is_monitoring:
+                    self.meditation_values = self.record(self.meditation_values, self.meditation_count, value)
+                    self.meditation_count += 1
+
+    def read_serial(self):
+        while self.reading:
+            try:
+                # Returns once 4096 bytes arrived or the 20 ms timeout expired
+                data = self.serial_port.read(4096)
+            except (serial.SerialException, OSError, TypeError):
+                break  # Port was closed underneath us
+            if data:
+                self.rx_chunks.append(data)
 
     def update_plot(self, frame):
-        if self.serial_port.in_waiting:
-            new_data = self.serial_port.read(self.serial_port.in_waiting)
-            self.packet_buffer.extend(new_data)
-            self.parse_packet()
+        # Parse chunk by chunk so at most a partial packet stays buffered
+        while self.rx_chunks:
+            self.parser.buffer_data(self.rx_chunks.popleft())
+            for payload in self.parser.parse_packets():
+                self.parse_payload(payload)
             
-        if len(self.raw_data) > 0:
-            self.line_eeg.set_data(range(len(self.raw_data)), list(self.raw_data))
-            self.ax1.set_xlim(0, len(self.raw_data))
+        # x data and limits are fixed at setup, so only y changes, and only
+        # for lines whose buffers received new samples since the last frame
+        if self.dirty['eeg']:
+            self.line_eeg.set_ydata(ring_view(self.raw_data, self.raw_head))
+            self.dirty['eeg'] = False
             
-        if len(self.attention_data) > 0:
-            self.line_attention.set_data(range(len(self.attention_data)), 
-                                       list(self.attention_data))
-            self.ax2.set_xlim(0, len(self.attention_data))
+        if self.dirty['attention']:
+            self.line_attention.set_ydata(ring_view(self.attention_data, self.attention_head))
+            self.dirty['attention'] = False
             
-        if len(self.meditation_data) > 0:
-            self.line_meditation.set_data(range(len(self.meditation_data)), 
-                                        list(self.meditation_data))
-            self.ax3.set_xlim(0, len(self.meditation_data))
+        if self.dirty['meditation']:
+            self.line_meditation.set_ydata(ring_view(self.meditation_data, self.meditation_head))
+            self.dirty['meditation'] = False
             
-        return self.line_eeg, self.line_attention, self.line_meditation
+        # The text artists are returned too: with blitting, anything not
+        # returned stays frozen in the cached background after set_text
+        return (self.line_eeg, self.line_attention, self.line_meditation,
+                self.signal_text, self.status_text, self.results_text)
 
     def run(self):
         print("\n=== MindSet Monitor ===")
@@ -290,8 +288,10 @@ class MindSetMonitor:
         plt.show()
 
     def close(self):
+        self.reading = False
         if self.serial_port.is_open:
             self.serial_port.close()
+        self.reader_thread.join(timeout=1)
         plt.close()
 
 if __name__ == "__main__":
@@ -1,11 +1,34 @@
 import serial
 import time
+import math
+import bisect
+import threading
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import numpy as np
 from collections import deque
 from matplotlib.widgets import Button
-from datetime import datetime
+from tgam_parser import TgamParser, decode_eeg_power, iter_values
+
+# Signal quality levels: the lowest value of each level after 'Excellent',
+# then (label, color) per level
+SIGNAL_QUALITY_BOUNDS = (1, 50, 100, 200)
+SIGNAL_QUALITY_LEVELS = (
+    ('Excellent', 'green'),
+    ('Good', 'green'),
+    ('Fair', 'yellow'),
+    ('Poor', 'red'),
+    ('No Contact', 'red')
+)
+
+# Stress levels: the lowest stress index of each level after 'Low',
+# then (label, color) per level
+STRESS_LEVEL_BOUNDS = (300, 700)
+STRESS_LEVELS = (
+    ('Low', 'green'),
+    ('Medium', 'yellow'),
+    ('High', 'red')
+)
 
 class BrainwaveMonitor:
     def __init__(self, port='/dev/cu.usbmodem497D486D324D1', baudrate=115200):
@@ -16,39 +39,59 @@ class BrainwaveMonitor:
             bytesize=serial.EIGHTBITS,
             parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE,
-            timeout=1
+            timeout=0.02  # Bounds how long the reader thread waits for a full chunk
         )
         
         self.buffer_size = 100
         self.signal_quality = 0
-        self.last_quality_print_time = time.time()
+        self.last_quality_print_time = time.monotonic()
         self.quality_print_interval = 1.0  # Print every 1 second
+        # Levels currently shown on screen, so unchanged text is not reset
+        self.shown_quality_level = None
+        self.shown_stress_level = None
         
         # Monitoring control
         self.is_monitoring = False
         self.monitoring_start_time = None
-        self.stress_values_during_monitoring = []
+        # Running stress statistics for the current session
+        self.stress_sum = 0.0
+        self.stress_count = 0
+        self.stress_min = math.inf
+        self.stress_max = -math.inf
         
-        # Initialize brainwave band buffers
-        self.bands = {
-            'Delta': deque(maxlen=self.buffer_size),     # 0.5 - 2.75 Hz
-            'Theta': deque(maxlen=self.buffer_size),     # 3.5 - 6.75 Hz
-            'Low-Alpha': deque(maxlen=self.buffer_size), # 7.5 - 9.25 Hz
-            'High-Alpha': deque(maxlen=self.buffer_size),# 10 - 11.75 Hz
-            'Low-Beta': deque(maxlen=self.buffer_size),  # 13 - 16.75 Hz
-            'High-Beta': deque(maxlen=self.buffer_size), # 18 - 29.75 Hz
-            'Low-Gamma': deque(maxlen=self.buffer_size), # 31 - 39.75 Hz
-            'Mid-Gamma': deque(maxlen=self.buffer_size)  # 41 - 49.75 Hz
-        }
+        # Brainwave band and stress buffers: one (signal, sample) ring with a
+        # shared write cursor; rows 0-7 are the bands, row 8 the stress index.
+        # Each column is written at ring_head and ring_head + buffer_size, so the
+        # latest buffer_size columns are always the contiguous slice starting at
+        # ring_head. Unfilled slots are NaN and are not drawn.
+        self.band_names = (
+            'Delta',      # 0.5 - 2.75 Hz
+            'Theta',      # 3.5 - 6.75 Hz
+            'Low-Alpha',  # 7.5 - 9.25 Hz
+            'High-Alpha', # 10 - 11.75 Hz
+            'Low-Beta',   # 13 - 16.75 Hz
+            'High-Beta',  # 18 - 29.75 Hz
+            'Low-Gamma',  # 31 - 39.75 Hz
+            'Mid-Gamma'   # 41 - 49.75 Hz
+        )
+        self.stress_row = len(self.band_names)
+        self.band_ring = np.full((len(self.band_names) + 1, 2 * self.buffer_size), np.nan, dtype=np.float32)
+        self.ring_head = 0   # Next column to write
+        self.ring_dirty = False  # New columns not yet plotted
+        self.x_axis = np.arange(self.buffer_size)
         
-        # Initialize metrics
-        self.stress_index = deque(maxlen=self.buffer_size)
-        self.packet_buffer = bytearray()
-        self.packet_state = 'SYNC1'
+        self.parser = TgamParser()
         
         # Setup visualization
         self.setup_visualization()
         
+        # Serial reads happen on a background thread and are handed over through
+        # a deque (append/popleft are atomic, so no lock is needed)
+        self.rx_chunks = deque()
+        self.reading = True
+        self.reader_thread = threading.Thread(target=self.read_serial, daemon=True)
+        self.reader_thread.start()
+        
     def setup_visualization(self):
         plt.style.use('dark_background')
         self.fig = plt.figure(figsize=(15, 10))
@@ -57,9 +100,12 @@ class BrainwaveMonitor:
         # Stress index plot
         self.stress_ax = self.fig.add_subplot(gs[0, :])
         self.stress_ax.set_title('Stress Index')
+        self.stress_ax.set_xlim(0, self.buffer_size)
         self.stress_ax.set_ylim(0, 1000)
         self.stress_ax.grid(True, alpha=0.3)
-        self.stress_line = self.stress_ax.plot([], [], 'r-', linewidth=2)[0]
+        self.stress_line = self.stress_ax.plot(
+            self.x_axis, self.band_ring[self.stress_row, :self.buffer_size], 'r-', linewidth=2
+        )[0]
         
         # Text displays with adjusted positions
         self.stress_text = self.stress_ax.text(
@@ -85,17 +131,20 @@ class BrainwaveMonitor:
         
         # Create subplots for brainwave bands
         self.axes = {}
-        for idx, (band_name, _) in enumerate(self.bands.items()):
+        for idx, band_name in enumerate(self.band_names):
             row = (idx // 2) + 1
             col = idx % 2
             ax = self.fig.add_subplot(gs[row, col])
             ax.set_title(f'{band_name} Wave')
+            ax.set_xlim(0, self.buffer_size)
             ax.set_ylim(0, 1000000)
             ax.grid(True, alpha=0.3)
             self.axes[band_name] = {
                 'ax': ax,
-                'line': ax.plot([], [], label=band_name)[0]
+                'line': ax.plot(self.x_axis, self.band_ring[idx, :self.buffer_size], label=band_name)[0]
             }
+        # Band lines in ring row order, for update_plot
+        self.band_lines = tuple(self.axes[band_name]['line'] for band_name in self.band_names)
         
         # Control buttons with adjusted positions
         button_color = '#2ECC71'  # Green color
@@ -112,28 +161,23 @@ class BrainwaveMonitor:
         plt.tight_layout()
 
     def print_signal_quality(self, quality):
-        current_time = time.time()
+        # Prints at most once per quality_print_interval; returns the quality
+        # level (an index into SIGNAL_QUALITY_LEVELS) either way
+        level = bisect.bisect_right(SIGNAL_QUALITY_BOUNDS, quality)
+        current_time = time.monotonic()
         if current_time - self.last_quality_print_time >= self.quality_print_interval:
-            quality_text = "Signal Quality: "
-            if quality == 0:
-                quality_text += "Excellent (0)"
-            elif quality < 50:
-                quality_text += f"Good ({quality})"
-            elif quality < 100:
-                quality_text += f"Fair ({quality})"
-            elif quality < 200:
-                quality_text += f"Poor ({quality})"
-            else:
-                quality_text += f"No Contact ({quality})"
-            
-            print(quality_text)
+            print(f"Signal Quality: {SIGNAL_QUALITY_LEVELS[level][0]} ({quality})")
             self.last_quality_print_time = current_time
+        return level
 
     def start_monitoring(self, event=None):
         if not self.is_monitoring:
             self.is_monitoring = True
-            self.monitoring_start_time = datetime.now()
-            self.stress_values_during_monitoring = []
+            self.monitoring_start_time = time.monotonic()
+            self.stress_sum = 0.0
+            self.stress_count = 0
+            self.stress_min = math.inf
+            self.stress_max = -math.inf
             print("\n=== Monitoring Started ===")
             self.start_btn.set_active(False)
             self.stop_btn.set_active(True)
@@ -141,16 +185,16 @@ class BrainwaveMonitor:
     def stop_monitoring(self, event=None):
         if self.is_monitoring:
             self.is_monitoring = False
-            duration = (datetime.now() - self.monitoring_start_time).total_seconds()
+            duration = time.monotonic() - self.monitoring_start_time
             
-            if self.stress_values_during_monitoring:
-                avg_stress = sum(self.stress_values_during_monitoring) / len(self.stress_values_during_monitoring)
+            if self.stress_count:
+                avg_stress = self.stress_sum / self.stress_count
                 result_text = f"\n=== Monitoring Results ===\n"
                 result_text += f"Duration: {duration:.1f} seconds\n"
                 result_text += f"Average Stress: {avg_stress:.1f}\n"
-                result_text += f"Samples: {len(self.stress_values_during_monitoring)}\n"
-                result_text += f"Min Stress: {min(self.stress_values_during_monitoring):.1f}\n"
-                result_text += f"Max Stress: {max(self.stress_values_during_monitoring):.1f}\n"
+                result_text += f"Samples: {self.stress_count}\n"
+                result_text += f"Min Stress: {self.stress_min:.1f}\n"
+                result_text += f"Max Stress: {self.stress_max:.1f}\n"
                 result_text += "======================="
                 
                 print(result_text)
@@ -159,167 +203,78 @@ class BrainwaveMonitor:
             self.start_btn.set_active(True)
             self.stop_btn.set_active(False)
 
-    def calculate_metrics(self):
-        if len(self.bands['Low-Alpha']) > 0 and len(self.bands['High-Alpha']) > 0 and \
-           len(self.bands['Low-Beta']) > 0 and len(self.bands['High-Beta']) > 0:
-            
-            total_alpha = (self.bands['Low-Alpha'][-1] + self.bands['High-Alpha'][-1])
-            total_beta = (self.bands['Low-Beta'][-1] + self.bands['High-Beta'][-1])
-            
-            if total_alpha > 0:
-                beta_alpha_ratio = total_beta / total_alpha
-                stress_value = min(1000, beta_alpha_ratio * 500)
-                self.stress_index.append(stress_value)
-                
-                if self.is_monitoring:
-                    self.stress_values_during_monitoring.append(stress_value)
-            else:
-                self.stress_index.append(0)
-                if self.is_monitoring:
-                    self.stress_values_during_monitoring.append(0)
-
     def parse_payload(self, payload):
-        i = 0
-        while i < len(payload):
-            extended_code_level = 0
-            while i < len(payload) and payload[i] == 0x55:
-                extended_code_level += 1
-                i += 1
-            
-            if i >= len(payload):
-                break
-            
-            code = payload[i]
-            i += 1
-            
-            if code & 0x80:
-                if i >= len(payload):
-                    break
-                length = payload[i]
-                i += 1
-                value_data = payload[i:i+length]
-                i += length
-                
-                if code == 0x83:  # ASIC_EEG_POWER
-                    if len(value_data) >= 24:
-                        for band_idx, (band_name, _) in enumerate(self.bands.items()):
-                            start_idx = band_idx * 3
-                            value = int.from_bytes(
-                                value_data[start_idx:start_idx+3], 
-                                byteorder='big',
-                                signed=False
-                            )
-                            self.bands[band_name].append(value)
-                        self.calculate_metrics()
-            
-            else:  # Single-byte value
-                if i >= len(payload):
-                    break
-                value = payload[i]
-                i += 1
-                
-                if code == 0x02:  # Poor signal quality
-                    self.print_signal_quality(value)
+        for code, value in iter_values(payload):
+            if code == 0x83:  # ASIC_EEG_POWER
+                if len(value) >= 24:
+                    values = decode_eeg_power(value)
                     
-                    quality_text = "Signal Quality: "
-                    if value == 0:
-                        quality_text += "Excellent"
-                        color = 'green'
-                    elif value < 50:
-                        quality_text += "Good"
-                        color = 'green'
-                    elif value < 100:
-                        quality_text += "Fair"
-                        color = 'yellow'
-                    elif value < 200:
-                        quality_text += "Poor"
-                        color = 'red'
+                    # Stress index from the beta/alpha ratio of this packet
+                    total_alpha = values[2] + values[3]  # Low + High Alpha
+                    total_beta = values[4] + values[5]   # Low + High Beta
+                    if total_alpha > 0:
+                        stress_value = min(1000.0, total_beta / total_alpha * 500)
                     else:
-                        quality_text += "No Contact"
-                        color = 'red'
+                        stress_value = 0.0
+                    if self.is_monitoring:
+                        self.stress_sum += stress_value
+                        self.stress_count += 1
+                        self.stress_min = min(self.stress_min, stress_value)
+                        self.stress_max = max(self.stress_max, stress_value)
                     
-                    self.quality_text.set_text(quality_text)
+                    # Bands and stress share one column of the ring
+                    column = self.band_ring[:, self.ring_head]
+                    column[:self.stress_row] = values
+                    column[self.stress_row] = stress_value
+                    self.band_ring[:, self.ring_head + self.buffer_size] = column
+                    self.ring_head = (self.ring_head + 1) % self.buffer_size
+                    self.ring_dirty = True
+            
+            elif code == 0x02:  # Poor signal quality
+                level = self.print_signal_quality(value)
+                if level != self.shown_quality_level:
+                    self.shown_quality_level = level
+                    label, color = SIGNAL_QUALITY_LEVELS[level]
+                    self.quality_text.set_text(f"Signal Quality: {label}")
                     self.quality_text.set_color(color)
 
-    def parse_packet(self):
-        while len(self.packet_buffer) > 0:
-            if self.packet_state == 'SYNC1':
-                if self.packet_buffer[0] == 0xAA:
-                    self.packet_state = 'SYNC2'
-                self.packet_buffer = self.packet_buffer[1:]
-            elif self.packet_state == 'SYNC2':
-                if len(self.packet_buffer) >= 1:
-                    if self.packet_buffer[0] == 0xAA:
-                        self.packet_state = 'PLENGTH'
-                    else:
-                        self.packet_state = 'SYNC1'
-                    self.packet_buffer = self.packet_buffer[1:]
-            elif self.packet_state == 'PLENGTH':
-                if len(self.packet_buffer) >= 1:
-                    plength = self.packet_buffer[0]
-                    if plength > 170:
-                        self.packet_state = 'SYNC1'
-                    else:
-                        self.packet_state = 'PAYLOAD'
-                    self.packet_buffer = self.packet_buffer[1:]
-                    self.payload_length = plength
-                    self.payload = bytearray()
-            elif self.packet_state == 'PAYLOAD':
-                if len(self.packet_buffer) >= self.payload_length:
-                    self.payload.extend(self.packet_buffer[:self.payload_length])
-                    self.packet_buffer = self.packet_buffer[self.payload_length:]
-                    self.packet_state = 'CHECKSUM'
-                else:
-                    break
-            elif self.packet_state == 'CHECKSUM':
-                if len(self.packet_buffer) >= 1:
-                    checksum = self.packet_buffer[0]
-                    self.packet_buffer = self.packet_buffer[1:]
-                    
-                    calculated_checksum = (~sum(self.payload) & 0xFF)
-                    if checksum == calculated_checksum:
-                        self.parse_payload(self.payload)
-                    
-                    self.packet_state = 'SYNC1'
-                else:
-                    break
+    def read_serial(self):
+        while self.reading:
+            try:
+                # Returns once 4096 bytes arrived or the 20 ms timeout expired
+                data = self.serial_port.read(4096)
+            except (serial.SerialException, OSError, TypeError):
+                break  # Port was closed underneath us
+            if data:
+                self.rx_chunks.append(data)
 
     def update_plot(self, frame):
-        if self.serial_port.in_waiting:
-            new_data = self.serial_port.read(self.serial_port.in_waiting)
-            self.packet_buffer.extend(new_data)
-            self.parse_packet()
+        # Parse chunk by chunk so at most a partial packet stays buffered
+        while self.rx_chunks:
+            self.parser.buffer_data(self.rx_chunks.popleft())
+            for payload in self.parser.parse_packets():
+                self.parse_payload(payload)
             
-        if len(self.stress_index) > 0:
-            self.stress_line.set_data(range(len(self.stress_index)), 
-                                    list(self.stress_index))
-            self.stress_ax.set_xlim(0, len(self.stress_index))
+        # Band packets arrive about once a second, so most frames have nothing new
+        if self.ring_dirty:
+            self.ring_dirty = False
+            # x data and limits are fixed at setup; only the y views change
+            window = self.band_ring[:, self.ring_head:self.ring_head + self.buffer_size]
+            self.stress_line.set_ydata(window[self.stress_row])
             
-            current_stress = self.stress_index[-1]
-            stress_text = "Stress Level: "
-            if current_stress < 300:
-                stress_text += "Low"
-                color = 'green'
-            elif current_stress < 700:
-                stress_text += "Medium"
-                color = 'yellow'
-            else:
-                stress_text += "High"
-                color = 'red'
+            level = bisect.bisect_right(STRESS_LEVEL_BOUNDS, window[self.stress_row, -1])
+            if level != self.shown_stress_level:
+                self.shown_stress_level = level
+                label, color = STRESS_LEVELS[level]
+                self.stress_text.set_text(f"Stress Level: {label}")
+                self.stress_text.set_color(color)
             
-            self.stress_text.set_text(stress_text)
-            self.stress_text.set_color(color)
-        
-        for band_name, band_data in self.bands.items():
-            if len(band_data) > 0:
-                self.axes[band_name]['line'].set_data(
-                    range(len(band_data)), 
-                    list(band_data)
-                )
-                self.axes[band_name]['ax'].set_xlim(0, len(band_data))
+            for line, row in zip(self.band_lines, window):
+                line.set_ydata(row)
         
-        return ([self.stress_line] + 
-                [data['line'] for data in self.axes.values()])
+        # The text artists are returned too: with blitting, anything not
+        # returned stays frozen in the cached background after set_text
+        return (self.stress_line, self.stress_text, self.quality_text, self.avg_stress_text) + self.band_lines
 
     def run(self):
         print("Starting brainwave monitoring system...")
@@ -327,15 +282,17 @@ class BrainwaveMonitor:
         ani = FuncAnimation(
             self.fig,
             self.update_plot,
-            interval=10,
+            interval=33,  # ~30 fps; parsing keeps up with the wire regardless
             blit=True,
             cache_frame_data=False
         )
         plt.show()
 
     def close(self):
+        self.reading = False
         if self.serial_port.is_open:
             self.serial_port.close()
+        self.reader_thread.join(timeout=1)
         plt.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+import struct
+
+# TGAM / ThinkGear serial protocol, shared by all the monitors.
+# Packet: [0xAA][0xAA][PLENGTH][PAYLOAD...][CHECKSUM]
+
+# Raw EEG sample: 16-bit big-endian signed
+RAW_SAMPLE = struct.Struct('>h')
+
+# Packet parser states
+SYNC1, SYNC2, PACKET = range(3)
+
+# ASIC_EEG_POWER with each 24-bit band value padded to 32 bits
+EEG_POWER = struct.Struct('>8I')
+
+def decode_eeg_power(value_data):
+    # ASIC_EEG_POWER: 8 bands × 3 bytes, each a big-endian unsigned 24-bit value.
+    # A zero byte goes in front of every triplet so the whole block unpacks in
+    # one call; returns a tuple of 8 ints.
+    b = bytes(value_data[:24])
+    return EEG_POWER.unpack(b'\x00' + b'\x00'.join((
+        b[0:3], b[3:6], b[6:9], b[9:12], b[12:15], b[15:18], b[18:21], b[21:24]
+    )))
+
+def iter_values(payload):
+    # Yields (code, value) for each data row of a payload: value is an int for
+    # single-byte codes and a zero-copy memoryview of the value bytes for
+    # multi-byte codes (0x80+)
+    view = memoryview(payload)
+    i = 0
+    while i < len(payload):
+        # Skip extended code bytes; TGAM only sends level-0 codes
+        while i < len(payload) and payload[i] == 0x55:
+            i += 1
+
+        if i >= len(payload):
+            break
+
+        code = payload[i]
+        i += 1
+
+        if code & 0x80:  # Multi-byte value
+            if i >= len(payload):
+                break
+            length = payload[i]
+            i += 1
+            yield code, view[i:i+length]
+            i += length
+
+        else:  # Single-byte value
+            if i >= len(payload):
+                break
+            yield code, payload[i]
+            i += 1
+
+class TgamParser:
+    def __init__(self, size=8192):
+        # Fixed receive buffer with read/write cursors
+        self.packet_buffer = bytearray(size)
+        self.read_pos = 0
+        self.write_pos = 0
+        self.packet_state = SYNC1
+
+    def buffer_data(self, data):
+        n = len(data)
+        if self.write_pos + n > len(self.packet_buffer):
+            # Move unread bytes to the front, growing only if they still don't fit
+            pending = self.write_pos - self.read_pos
+            self.packet_buffer[:pending] = self.packet_buffer[self.read_pos:self.write_pos]
+            self.read_pos, self.write_pos = 0, pending
+            if pending + n > len(self.packet_buffer):
+                self.packet_buffer.extend(bytes(pending + n - len(self.packet_buffer)))
+        self.packet_buffer[self.write_pos:self.write_pos + n] = data
+        self.write_pos += n
+
+    def parse_packets(self):
+        # Consumes all complete packets in the buffer and returns the payloads
+        # that passed their checksum. The scan runs on locals only: find() jumps
+        # to each sync pair and whole packets are validated in place, so state
+        # is only kept across calls for a packet cut off at the end of the data.
+        payloads = []
+        buf = self.packet_buffer
+        pos, end = self.read_pos, self.write_pos
+        state = self.packet_state
+
+        if state == SYNC2 and pos < end:
+            # Second byte of a sync pair split across reads
+            state = PACKET if buf[pos] == 0xAA else SYNC1
+            pos += 1
+
+        while pos < end:
+            if state == SYNC1:
+                sync = buf.find(b'\xAA\xAA', pos, end)
+                if sync < 0:
+                    if buf[end - 1] == 0xAA:
+                        state = SYNC2
+                    pos = end
+                    break
+                state = PACKET
+                pos = sync + 2
+                if pos == end:
+                    break
+
+            # [PLENGTH][PAYLOAD...][CHECKSUM]
+            plength = buf[pos]
+            if plength > 170:
+                state = SYNC1
+                pos += 1
+                continue
+            if end - pos < plength + 2:
+                break
+
+            payload = buf[pos + 1:pos + plength + 1]
+            # Plain sum() over the bytearray stays: for payloads of at most
+            # 170 bytes it is faster than an np.frombuffer(...).sum() reduction
+            if buf[pos + plength + 1] == (~sum(payload) & 0xFF):
+                payloads.append(payload)
+            pos += plength + 2
+            state = SYNC1
+
+        # Rewind the cursors whenever everything has been consumed. Otherwise only
+        # a partial packet (under 172 bytes) is left; once the read cursor is
+        # past the halfway mark, move it to the front so the next appends have
+        # room without compacting or growing the buffer.
+        if pos == end:
+            pos = end = 0
+        elif pos > len(buf) // 2:
+            buf[:end - pos] = buf[pos:end]
+            pos, end = 0, end - pos
+        self.read_pos, self.write_pos = pos, end
+        self.packet_state = state
+        return payloads